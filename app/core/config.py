@@ -1,3 +1,4 @@
+from functools import lru_cache
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import List
@@ -17,8 +18,16 @@ class Settings(BaseSettings):
     N8N_WEBHOOK_URL: str = Field(default="", description="n8n webhook URL")
     N8N_INTERNAL_TOKEN: str = Field(default="", description="Internal header for n8n (optional)")
     HTTP_TIMEOUT_S: float = Field(default=30.0)
+    HTTP_MAX_CONNECTIONS: int = Field(default=200, description="Shared httpx client connection cap")
+    HTTP_MAX_KEEPALIVE: int = Field(default=100, description="Idle connections kept open for reuse")
+    HTTP_KEEPALIVE_EXPIRY_S: float = Field(default=60.0, description="Seconds an idle connection is kept")
     DEFAULT_VOICE_ID: str = Field(default="YOUR_DEFAULT_VOICE_ID")
     DEFAULT_TTS_FORMAT: str = Field(default="mp3_44100_128")
+    TTS_STREAM_CHUNK_BYTES: int = Field(
+        default=0,
+        ge=0,
+        description="Re-chunk streamed TTS audio to this many bytes; 0 forwards network reads as they arrive",
+    )
     MAX_UPLOAD_MB: int = Field(default=10, description="Max upload size in megabytes")
     CORS_ORIGINS: List[str] = []
 
@@ -26,8 +35,16 @@ class Settings(BaseSettings):
     FFMPEG_PATH: str = Field(default="", description="Absolute path to ffmpeg executable (e.g., C\\ffmpeg\\bin\\ffmpeg.exe)")
     FFMPEG_BIN: str = Field(default="", description="Alternative env name for ffmpeg executable path")
 
-    # pydantic v2 uses SettingsConfigDict for settings configuration
-    model_config = SettingsConfigDict(env_file=".env", case_sensitive=True)
+    # pydantic v2 uses SettingsConfigDict for settings configuration;
+    # frozen since nothing mutates settings after startup
+    model_config = SettingsConfigDict(env_file=".env", case_sensitive=True, frozen=True)
 
 
-settings = Settings()
\ No newline at end of file
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Build Settings once; call get_settings.cache_clear() to re-read env/.env."""
+    return Settings()
+
+
+# Backward-compatible module-level instance
+settings = get_settings()
@@ -1,15 +1,17 @@
-import json
+import asyncio
 import logging
+from functools import lru_cache
 from typing import Optional
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 import httpx
+import orjson
 
 from app.service.sttServices import stt_raw_bytes_to_text
 from app.service.orchSerenityAi import forward_to_n8n
 from app.service.ttsServices import stream_text_to_speech
 from app.utils.text_utils import clean_for_tts
-from app.utils.audio_utils import convert_to_wav
+from app.utils.audio_utils import convert_to_wav_async
 """
 Note: Avoid importing helpers from server.py to prevent circular imports.
 HTTP client attached in app.state is accessed via the WebSocket's app reference.
@@ -18,6 +20,133 @@ HTTP client attached in app.state is accessed via the WebSocket's app reference.
 router = APIRouter(prefix="/rt", tags=["realtime"])  # rt = realtime
 logger = logging.getLogger(__name__)
 
+# Outbound TTS audio is coalesced into frames of up to this many bytes, or
+# whatever arrived within the batching window, whichever comes first.
+_WS_BATCH_BYTES = 16 * 1024
+_WS_BATCH_WINDOW_S = 0.005
+
+
+def _json_text(obj) -> str:
+    """Serialize an event payload for send_text (orjson emits bytes)."""
+    return orjson.dumps(obj).decode()
+
+
+# Constant event frames, serialized once at import. They stay text frames:
+# the client treats every binary frame as audio.
+_READY_FRAME = _json_text({"event": "ready"})
+_AUDIO_END_FRAME = _json_text({"event": "audio_end"})
+_UNKNOWN_TEXT_FRAME = _json_text({"event": "error", "detail": "unknown_text_frame"})
+_EMPTY_AUDIO_FRAME = _json_text({"event": "error", "detail": "empty_audio"})
+_NO_TEXT_FRAME = _json_text({"event": "error", "detail": "no_text"})
+
+
+# Standard empathetic fallback when n8n flags a crisis but returns no text
+_CRISIS_STANDARD_MSG = (
+    "Aku menyesal kamu sedang merasa seperti ini. Keselamatanmu sangat penting. "
+    "Jika kamu dalam bahaya segera, mohon hubungi layanan darurat setempat. "
+    "Kamu tidak sendirian—dukungan dari orang tepercaya atau profesional bisa membantu. "
+    "Jika berkenan, aku bisa membagikan informasi bantuan resmi sesuai wilayahmu."
+)
+
+# Hard block fallback for method intent or severe cases
+_CRISIS_HARDBLOCK_MSG = (
+    "Keselamatanmu sangat penting. Jika kamu dalam bahaya segera, mohon hubungi layanan darurat setempat sekarang. "
+    "Kami tidak dapat memberikan detail cara atau langkah. Kamu tidak sendirian—dukungan dari orang tepercaya atau profesional bisa membantu. "
+    "Jika berkenan, aku bisa membagikan informasi bantuan resmi sesuai wilayahmu."
+)
+
+# Crisis events for the fallback messages when there is no meta to attach
+_CRISIS_FALLBACK_FRAMES = {
+    msg: _json_text({"event": "crisis", "type": "crisis", "text": msg, "meta": None})
+    for msg in (_CRISIS_STANDARD_MSG, _CRISIS_HARDBLOCK_MSG)
+}
+
+
+@lru_cache(maxsize=32)
+def _audio_start_frame(media_type: str, response_type: str) -> str:
+    """audio_start only varies by (media_type, type), both from small closed sets."""
+    return _json_text({"event": "audio_start", "media_type": media_type, "type": response_type})
+
+
+async def _send_audio_batched(ws: WebSocket, chunks) -> None:
+    """Forward TTS audio chunks to the client, merging small chunks into fewer frames.
+
+    The next upstream chunk is always being fetched by a task, so receiving
+    from ElevenLabs overlaps with sending to the client, and a batching
+    timeout never cancels the upstream generator (which would abort the TTS
+    stream). Chunks that arrive while a send is in flight join the next batch.
+    """
+    loop = asyncio.get_running_loop()
+    it = chunks.__aiter__()
+    pending = bytearray()
+    first_ts = 0.0
+    next_chunk = asyncio.ensure_future(it.__anext__())
+    try:
+        while True:
+            if pending:
+                remaining = _WS_BATCH_WINDOW_S - (loop.time() - first_ts)
+                done, _ = await asyncio.wait({next_chunk}, timeout=max(remaining, 0))
+                if not done:
+                    # Window elapsed with nothing new: flush what we have
+                    await ws.send_bytes(bytes(pending))
+                    pending.clear()
+                    continue
+            try:
+                chunk = await next_chunk
+            except StopAsyncIteration:
+                break
+            # Prefetch the following chunk before any send below
+            next_chunk = asyncio.ensure_future(it.__anext__())
+            if not pending:
+                first_ts = loop.time()
+            pending.extend(chunk)
+            if len(pending) >= _WS_BATCH_BYTES or loop.time() - first_ts >= _WS_BATCH_WINDOW_S:
+                await ws.send_bytes(bytes(pending))
+                pending.clear()
+        if pending:
+            await ws.send_bytes(bytes(pending))
+    finally:
+        if not next_chunk.done():
+            next_chunk.cancel()
+
+
+# Initial capacity of each session's utterance buffer (several seconds of Opus)
+_UTTERANCE_PREALLOC = 256 * 1024
+
+
+class _UtteranceBuffer:
+    """Preallocated audio buffer reused across the utterances of one session.
+
+    Chunks are copied in at a write offset that is reset on clear(), so the
+    backing bytearray is only reallocated (doubling) when an utterance
+    outgrows it, instead of growing from empty every time.
+    """
+
+    __slots__ = ("_buf", "_size")
+
+    def __init__(self, capacity: int = _UTTERANCE_PREALLOC):
+        self._buf = bytearray(capacity)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def extend(self, chunk: bytes) -> None:
+        end = self._size + len(chunk)
+        if end > len(self._buf):
+            grown = bytearray(max(end, 2 * len(self._buf)))
+            grown[:self._size] = memoryview(self._buf)[:self._size]
+            self._buf = grown
+        self._buf[self._size:end] = chunk
+        self._size = end
+
+    def view(self) -> memoryview:
+        """Zero-copy view of the buffered bytes; release it before the next extend()."""
+        return memoryview(self._buf)[:self._size]
+
+    def clear(self) -> None:
+        self._size = 0
+
 
 @router.websocket("/chat")
 async def chat_socket(ws: WebSocket):
@@ -29,22 +158,27 @@ async def chat_socket(ws: WebSocket):
     http: httpx.AsyncClient = getattr(app_obj.state, "http_client", None)
     if http is None:
         raise RuntimeError("HTTP client not initialized; check app lifespan setup")
+    ffmpeg_pool = getattr(app_obj.state, "ffmpeg_pool", None)
 
-    buffer = bytearray()
+    buffer = _UtteranceBuffer()
     session_id: Optional[str] = None
     language: Optional[str] = None
     input_mime: Optional[str] = None
 
+    # Message read ahead while draining audio frames, dispatched next iteration
+    pending: Optional[dict] = None
+
     try:
         while True:
-            msg = await ws.receive()
+            msg = pending or await ws.receive()
+            pending = None
             if msg.get("type") == "websocket.disconnect":
                 break
 
             if "text" in msg and msg["text"] is not None:
                 try:
-                    data = json.loads(msg["text"]) if msg["text"] else {}
-                except Exception:
+                    data = orjson.loads(msg["text"]) if msg["text"] else {}
+                except orjson.JSONDecodeError:
                     data = {"type": "invalid"}
 
                 mtype = data.get("type")
@@ -54,20 +188,22 @@ async def chat_socket(ws: WebSocket):
                     session_id = data.get("session_id")
                     language = data.get("language")
                     input_mime = data.get("content_type") or data.get("mime") or "audio/webm"
-                    await ws.send_text(json.dumps({"event": "ready"}))
+                    await ws.send_text(_READY_FRAME)
                 elif mtype == "stop":
                     # Process current buffer as one utterance
                     if not buffer:
-                        await ws.send_text(json.dumps({"event": "error", "detail": "empty_audio"}))
+                        await ws.send_text(_EMPTY_AUDIO_FRAME)
                         continue
 
                     # Convert to WAV (required by STT) then transcribe
                     try:
-                        wav_bytes = convert_to_wav(bytes(buffer), input_mime=input_mime)
+                        # Hand ffmpeg a view of the buffer instead of copying it
+                        with buffer.view() as view:
+                            wav_bytes = await convert_to_wav_async(view, input_mime=input_mime, executor=ffmpeg_pool)
                         logger.info("WS utterance bytes=%d converted to WAV=%d", len(buffer), len(wav_bytes))
                     except Exception as conv_err:
                         logger.warning("WAV conversion failed: %s", conv_err)
-                        await ws.send_text(json.dumps({
+                        await ws.send_text(_json_text({
                             "event": "error",
                             "detail": "wav_conversion_failed",
                             "message": str(conv_err)[:200],
@@ -115,26 +251,11 @@ async def chat_socket(ws: WebSocket):
                             # boolean flags
                             method_intent = bool(result.get("method_intent") or (isinstance(meta, dict) and meta.get("method_intent")))
 
-                        # Standard empathetic fallback
-                        standard_msg = (
-                            "Aku menyesal kamu sedang merasa seperti ini. Keselamatanmu sangat penting. "
-                            "Jika kamu dalam bahaya segera, mohon hubungi layanan darurat setempat. "
-                            "Kamu tidak sendirian—dukungan dari orang tepercaya atau profesional bisa membantu. "
-                            "Jika berkenan, aku bisa membagikan informasi bantuan resmi sesuai wilayahmu."
-                        )
-
-                        # Hard block fallback for method intent or severe cases
-                        hardblock_msg = (
-                            "Keselamatanmu sangat penting. Jika kamu dalam bahaya segera, mohon hubungi layanan darurat setempat sekarang. "
-                            "Kami tidak dapat memberikan detail cara atau langkah. Kamu tidak sendirian—dukungan dari orang tepercaya atau profesional bisa membantu. "
-                            "Jika berkenan, aku bisa membagikan informasi bantuan resmi sesuai wilayahmu."
-                        )
-
                         # Choose hard block when subtype indicates or method_intent true
                         if (subtype and str(subtype).lower() in ("hard_block", "hard-block")) or method_intent:
-                            response_text = hardblock_msg
+                            response_text = _CRISIS_HARDBLOCK_MSG
                         else:
-                            response_text = standard_msg
+                            response_text = _CRISIS_STANDARD_MSG
                         response_type = "crisis"
 
                     if not response_text:
@@ -143,11 +264,11 @@ async def chat_socket(ws: WebSocket):
                         logger.info("no_text: transcript_chars=%d result=%s", len(transcript or ""), result)
                         try:
                             debug_payload = {"event": "debug", "transcript": transcript, "n8n_result": result}
-                            await ws.send_text(json.dumps(debug_payload))
+                            await ws.send_text(_json_text(debug_payload))
                         except Exception:
                             # If result isn't JSON-serializable, send a compact string
-                            await ws.send_text(json.dumps({"event": "debug", "transcript": transcript, "n8n_result": str(result)}))
-                        await ws.send_text(json.dumps({"event": "error", "detail": "no_text"}))
+                            await ws.send_text(_json_text({"event": "debug", "transcript": transcript, "n8n_result": str(result)}))
+                        await ws.send_text(_NO_TEXT_FRAME)
                         buffer.clear()
                         continue
 
@@ -158,15 +279,20 @@ async def chat_socket(ws: WebSocket):
                         meta = None
                         if isinstance(result, dict):
                             meta = result.get("meta")
-                        await ws.send_text(json.dumps({
-                            "event": "crisis",
-                            "type": response_type,
-                            "text": response_text,
-                            "meta": meta,
-                        }))
+                        frame = None
+                        if meta is None and isinstance(response_text, str):
+                            frame = _CRISIS_FALLBACK_FRAMES.get(response_text)
+                        if frame is None:
+                            frame = _json_text({
+                                "event": "crisis",
+                                "type": response_type,
+                                "text": response_text,
+                                "meta": meta,
+                            })
+                        await ws.send_text(frame)
                         # Clear and notify ready for next utterance
                         buffer.clear()
-                        await ws.send_text(json.dumps({"event": "ready"}))
+                        await ws.send_text(_READY_FRAME)
                         continue
 
                     # Clean text for TTS
@@ -178,27 +304,28 @@ async def chat_socket(ws: WebSocket):
                         text=response_text,
                         response_type=response_type,
                     )
-                    await ws.send_text(json.dumps({
-                        "event": "audio_start",
-                        "media_type": media_type,
-                        "type": response_type or "unknown",
-                    }))
+                    await ws.send_text(_audio_start_frame(media_type, response_type or "unknown"))
                     logger.info("WS TTS streaming start: media_type=%s", media_type)
-                    async for chunk in aiter:
-                        await ws.send_bytes(chunk)
+                    await _send_audio_batched(ws, aiter)
                     logger.info("WS TTS streaming end")
-                    await ws.send_text(json.dumps({"event": "audio_end"}))
+                    await ws.send_text(_AUDIO_END_FRAME)
 
                     # Clear buffer for next utterance and notify client we're ready for next input
                     buffer.clear()
                     logger.info("WS ready for next utterance")
-                    await ws.send_text(json.dumps({"event": "ready"}))
+                    await ws.send_text(_READY_FRAME)
                 else:
-                    await ws.send_text(json.dumps({"event": "error", "detail": "unknown_text_frame"}))
+                    await ws.send_text(_UNKNOWN_TEXT_FRAME)
 
             elif "bytes" in msg and msg["bytes"] is not None:
-                # Accumulate binary audio chunk
-                buffer.extend(msg["bytes"])
+                # Accumulate the whole burst of binary audio frames here. Frames
+                # the server has already queued come back from receive() without
+                # suspending; the first non-audio message goes back to dispatch.
+                chunk = msg["bytes"]
+                while chunk is not None:
+                    buffer.extend(chunk)
+                    pending = await ws.receive()
+                    chunk = pending.get("bytes")
             else:
                 # Ignore other message types
                 pass
@@ -207,7 +334,7 @@ async def chat_socket(ws: WebSocket):
         return
     except Exception as e:
         try:
-            await ws.send_text(json.dumps({"event": "error", "detail": str(e)}))
+            await ws.send_text(_json_text({"event": "error", "detail": str(e)}))
         except Exception:
             pass
         return
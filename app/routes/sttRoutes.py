@@ -3,13 +3,14 @@ from fastapi import HTTPException
 from app.schema.schema import STTResponse, ChatResponse
 from app.service.sttServices import stt_bytes_to_text
 from app.service.orchSerenityAi import forward_to_n8n
+from app.utils.text_utils import split_type_tag
 
 router = APIRouter(tags=["stt"])
 
 @router.post("/stt", response_model=STTResponse)
 async def stt_only(request: Request, audio: UploadFile = File(...), language: str | None = Form(None)):
     http = request.app.state.http_client
-    transcript = await stt_bytes_to_text(http, audio, language)
+    transcript = await stt_bytes_to_text(http, audio, language, executor=getattr(request.app.state, "ffmpeg_pool", None))
     return STTResponse(transcript=transcript)
 
 @router.post("/stt-chat", response_model=ChatResponse)
@@ -20,7 +21,7 @@ async def stt_then_chat(
     language: str | None = Form(None),
 ):
     http = request.app.state.http_client
-    transcript = await stt_bytes_to_text(http, audio, language)
+    transcript = await stt_bytes_to_text(http, audio, language, executor=getattr(request.app.state, "ffmpeg_pool", None))
     result = await forward_to_n8n(http, session_id, transcript)
     if "type" in result and "text" in result:
         return ChatResponse(
@@ -30,16 +31,9 @@ async def stt_then_chat(
             meta=result.get("meta"),
         )
     if isinstance(result, dict) and "output" in result and isinstance(result["output"], str):
-        raw = result["output"]
-        parsed_type = "chat"
-        text = raw
-        import re
-        m = re.search(r"\[\[type:([a-zA-Z0-9_\-]+)\]\]", raw)
-        if m:
-            parsed_type = m.group(1)
-            text = re.sub(r"\[\[type:[a-zA-Z0-9_\-]+\]\]", "", raw).strip()
+        parsed_type, text = split_type_tag(result["output"])
         return ChatResponse(
-            type=parsed_type,
+            type=parsed_type or "chat",
             text=text,
             crisis_flag=result.get("crisis_flag"),
             meta=result.get("meta"),
@@ -1,47 +1,77 @@
 from typing import Optional
 import time
-from fastapi import APIRouter, File, Form, HTTPException, UploadFile, Response, Request
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile, Request
 from app.service.sttServices import stt_bytes_to_text
 from app.service.orchSerenityAi import forward_to_n8n
 from app.service.ttsServices import text_to_speech, stream_text_to_speech
 from fastapi.responses import StreamingResponse
-from app.utils.text_utils import clean_for_tts
+from app.utils.text_utils import clean_for_tts, split_type_tag
 
 router = APIRouter(prefix="/tts", tags=["tts"])
 
+# Keep nginx/CDNs from re-buffering or transforming streamed audio
+_STREAMING_HEADERS = {
+    "X-Accel-Buffering": "no",
+    "Cache-Control": "no-transform",
+}
+
+
+async def _prime_audio(chunks):
+    """Wait for the first audio chunk before the response starts streaming.
+
+    Upstream TTS errors then still turn into regular HTTP error responses,
+    and the wait doubles as a time-to-first-byte measurement.
+    """
+    it = chunks.__aiter__()
+    try:
+        first = await it.__anext__()
+    except StopAsyncIteration:
+        first = b""
+
+    async def _replay():
+        if first:
+            yield first
+        async for chunk in it:
+            yield chunk
+
+    return _replay()
+
 
 def _normalize_n8n_result(data):
     """Normalize various n8n response shapes into a dict with keys: text, type, crisis_flag, meta.
     Accepts direct dict, {json: {...}}, {body: {...}}, or a list wrapping those.
+    Dicts that already carry both text and type are returned as-is.
     """
-    import re
-
-    # Unwrap list
-    if isinstance(data, list) and data:
-        data = data[0]
-    if isinstance(data, dict):
-        if "json" in data and isinstance(data["json"], dict):
-            data = data["json"]
-        elif "body" in data and isinstance(data["body"], dict):
-            data = data["body"]
-
-    result = {"text": None, "type": None, "crisis_flag": None, "meta": {}}
-    if isinstance(data, dict):
-        result["text"] = data.get("text") or data.get("output") or data.get("response")
-        result["type"] = data.get("type")
-        result["crisis_flag"] = data.get("crisis_flag")
-        meta = data.get("meta")
-        if isinstance(meta, dict):
-            result["meta"] = meta
-    elif isinstance(data, str):
-        result["text"] = data
+    # Unwrap list, then a {json: ...} / {body: ...} envelope
+    match data:
+        case [first, *_]:
+            data = first
+    match data:
+        case {"json": dict() as inner} | {"body": dict() as inner}:
+            data = inner
+
+    match data:
+        case {"text": str() as text, "type": str() as rtype} if text and rtype:
+            return data
+        case dict():
+            meta = data.get("meta")
+            result = {
+                "text": data.get("text") or data.get("output") or data.get("response"),
+                "type": data.get("type"),
+                "crisis_flag": data.get("crisis_flag"),
+                "meta": meta if isinstance(meta, dict) else {},
+            }
+        case str():
+            result = {"text": data, "type": None, "crisis_flag": None, "meta": {}}
+        case _:
+            result = {"text": None, "type": None, "crisis_flag": None, "meta": {}}
 
     # Fallback: parse [[type:...]] tag from text
     if result["text"] and not result["type"]:
-        m = re.search(r"\[\[type:([a-zA-Z0-9_\-]+)\]\]", result["text"]) 
-        if m:
-            result["type"] = m.group(1)
-            result["text"] = re.sub(r"\[\[type:[a-zA-Z0-9_\-]+\]\]", "", result["text"]).strip()
+        tag_type, stripped = split_type_tag(result["text"])
+        if tag_type:
+            result["type"] = tag_type
+            result["text"] = stripped
 
     return result
 
@@ -61,7 +91,7 @@ async def stt_chat_tts(
     upload = file or audio
     if upload is None:
         raise HTTPException(422, "Missing file upload: provide 'file' or 'audio' field")
-    text = await stt_bytes_to_text(http, upload, language)
+    text = await stt_bytes_to_text(http, upload, language, executor=getattr(request.app.state, "ffmpeg_pool", None))
     t_stt = time.perf_counter()
 
     # Forward to n8n for chat orchestration
@@ -83,12 +113,13 @@ async def stt_chat_tts(
     if not response_text:
         raise HTTPException(502, "n8n did not return text")
 
-    # TTS
-    audio_bytes, media_type = await text_to_speech(
+    # TTS: streamed through, so this measures time to the first audio byte
+    aiter, media_type = await text_to_speech(
         http=http,
         text=response_text,
         response_type=response_type,
     )
+    aiter = await _prime_audio(aiter)
     t_tts = time.perf_counter()
 
     # Add simple timing headers
@@ -99,9 +130,10 @@ async def stt_chat_tts(
         "X-Chat-Type": (response_type or "unknown"),
         "X-Chat-Crisis": str(bool(crisis_flag)),
         "X-Chat-Text-Len": str(len(response_text or "")),
+        **_STREAMING_HEADERS,
     }
 
-    return Response(content=audio_bytes, media_type=media_type, headers=headers)
+    return StreamingResponse(aiter, media_type=media_type, headers=headers)
 
 
 @router.post("/stt-chat-tts-stream")
@@ -122,7 +154,7 @@ async def stt_chat_tts_stream(
     upload = file or audio
     if upload is None:
         raise HTTPException(422, "Missing file upload: provide 'file' or 'audio' field")
-    text = await stt_bytes_to_text(http, upload, language)
+    text = await stt_bytes_to_text(http, upload, language, executor=getattr(request.app.state, "ffmpeg_pool", None))
 
     # Forward to n8n
     if not session_id:
@@ -143,5 +175,6 @@ async def stt_chat_tts_stream(
         text=response_text,
         response_type=response_type,
     )
+    aiter = await _prime_audio(aiter)
 
-    return StreamingResponse(aiter, media_type=media_type)
+    return StreamingResponse(aiter, media_type=media_type, headers=_STREAMING_HEADERS)
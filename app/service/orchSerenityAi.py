@@ -1,12 +1,45 @@
 from fastapi import HTTPException
 import logging
 import httpx
-import json
-from app.core.config import settings
+import orjson
+from app.core.config import get_settings
 
 logger = logging.getLogger(__name__)
 
 
+def reload_settings() -> None:
+    """Refresh the n8n URL and headers from get_settings(); other modules keep their own copies."""
+    global N8N_URL, _N8N_HEADERS
+    settings = get_settings()
+    N8N_URL = settings.N8N_WEBHOOK_URL
+    _N8N_HEADERS = {"content-type": "application/json"}
+    if settings.N8N_INTERNAL_TOKEN:
+        _N8N_HEADERS["X-Internal-Token"] = settings.N8N_INTERNAL_TOKEN
+
+
+reload_settings()
+
+
+def _parse_json_value(val):
+    """Set-node json values arrive as JSON text; keep the raw value if it doesn't parse."""
+    try:
+        return orjson.loads(val)
+    except orjson.JSONDecodeError:
+        return val
+
+
+def _identity(val):
+    return val
+
+
+# Converters for n8n Set-node values by value type; other types pass through
+_VALUE_CONVERTERS = {
+    "json": _parse_json_value,
+    # n8n may use truthy values; normalize to bool
+    "boolean": bool,
+}
+
+
 async def forward_to_n8n(http: httpx.AsyncClient, session_id: str, text: str) -> dict:
     """Forward plain payload to n8n webhook and normalize common n8n response shapes.
 
@@ -14,24 +47,20 @@ async def forward_to_n8n(http: httpx.AsyncClient, session_id: str, text: str) ->
     This function will attempt to extract a usable dict (the inner `json`) or
     return a reasonable fallback containing raw text.
     """
-    if not settings.N8N_WEBHOOK_URL:
+    if not N8N_URL:
         raise HTTPException(500, "N8N_WEBHOOK_URL not set")
 
-    headers = {"content-type": "application/json"}
-    if settings.N8N_INTERNAL_TOKEN:
-        headers["X-Internal-Token"] = settings.N8N_INTERNAL_TOKEN
-
     payload = {"session_id": session_id, "text": text}
 
-    resp = await http.post(settings.N8N_WEBHOOK_URL, headers=headers, json=payload)
+    resp = await http.post(N8N_URL, headers=_N8N_HEADERS, content=orjson.dumps(payload))
     if resp.status_code >= 400:
         raise HTTPException(resp.status_code, f"n8n error: {resp.text}")
 
     # Try to parse JSON and normalize common n8n shapes
     try:
-        data = resp.json()
-    except Exception:
-        logger.debug("n8n non-json response: %s", resp.text)
+        data = orjson.loads(resp.content)
+    except orjson.JSONDecodeError:
+        logger.debug("n8n non-json response: %r", resp.content[:256])
         return {"raw": resp.text}
 
     # n8n often returns a list like [{"json": {...}}]
@@ -50,25 +79,13 @@ async def forward_to_n8n(http: httpx.AsyncClient, session_id: str, text: str) ->
     if isinstance(data, dict):
         vals = data.get("values")
         if isinstance(vals, dict):
-            normalized = {}
-            for vtype, entries in vals.items():
-                if not isinstance(entries, list):
-                    continue
-                for e in entries:
-                    name = e.get("name")
-                    val = e.get("value")
-                    if name is None:
-                        continue
-                    if vtype == "json":
-                        try:
-                            normalized[name] = json.loads(val)
-                        except Exception:
-                            normalized[name] = val
-                    elif vtype == "boolean":
-                        # n8n may use truthy values; normalize to bool
-                        normalized[name] = bool(val)
-                    else:
-                        normalized[name] = val
+            normalized = {
+                e["name"]: _VALUE_CONVERTERS.get(vtype, _identity)(e.get("value"))
+                for vtype, entries in vals.items()
+                if isinstance(entries, list)
+                for e in entries
+                if e.get("name") is not None
+            }
             if normalized:
                 return normalized
         return data
@@ -1,46 +1,113 @@
+from concurrent.futures import Executor
 from fastapi import UploadFile, HTTPException
 import httpx
-from app.core.config import settings
-from app.utils.audio_utils import convert_to_wav
+import orjson
+from app.core.config import get_settings
+from app.utils.audio_utils import WAV_MIMES, convert_to_wav_async
 
-async def stt_bytes_to_text(http: httpx.AsyncClient, audio: UploadFile, language: str | None) -> str:
-    if not settings.XI_API_KEY:
+
+def reload_settings() -> None:
+    """Re-read this module's STT key, URL, model and size limit from get_settings()."""
+    global XI_KEY, STT_URL, STT_MODEL, MAX_BYTES, _STT_HEADERS
+    settings = get_settings()
+    XI_KEY = settings.XI_API_KEY
+    STT_URL = settings.ELEVEN_STT_URL
+    STT_MODEL = settings.ELEVEN_STT_MODEL_ID
+    MAX_BYTES = int(settings.MAX_UPLOAD_MB * 1024 * 1024)
+    _STT_HEADERS = {
+        "xi-api-key": XI_KEY,
+        "accept": "application/json",
+    }
+
+
+reload_settings()
+
+# Uploads are sized in chunks of this many bytes before being handed to httpx
+_UPLOAD_CHUNK_BYTES = 64 * 1024
+
+
+class _UploadReader:
+    """read/seek/tell view of an upload's spool file for httpx multipart.
+
+    httpx sizes file fields via fileno() when available, which forces a
+    SpooledTemporaryFile onto disk; without it the size comes from seek/tell.
+    """
+
+    __slots__ = ("_f",)
+
+    def __init__(self, f):
+        self._f = f
+
+    def read(self, size: int = -1) -> bytes:
+        return self._f.read(size)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self._f.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._f.tell()
+
+
+async def _measure_upload(audio: UploadFile, max_bytes: int) -> int:
+    """Size an upload, failing as soon as it exceeds max_bytes.
+
+    Starlette records the size of multipart uploads as it spools them, which
+    makes this O(1). Otherwise the upload is walked chunk by chunk; the chunks
+    are discarded and the file is rewound for httpx to stream from.
+    """
+    if audio.size is not None:
+        if audio.size > max_bytes:
+            raise HTTPException(400, f"Audio exceeds max size of {max_bytes // (1024 * 1024)} MB")
+        return audio.size
+
+    total = 0
+    while chunk := await audio.read(_UPLOAD_CHUNK_BYTES):
+        total += len(chunk)
+        if total > max_bytes:
+            raise HTTPException(400, f"Audio exceeds max size of {max_bytes // (1024 * 1024)} MB")
+    await audio.seek(0)
+    return total
+
+
+async def stt_bytes_to_text(
+    http: httpx.AsyncClient,
+    audio: UploadFile,
+    language: str | None,
+    executor: Executor | None = None,
+) -> str:
+    """Transcribe an upload; non-WAV audio is converted on `executor` (see convert_to_wav_async)."""
+    if not XI_KEY:
         raise HTTPException(500, "XI_API_KEY not set")
 
-    audio_bytes = await audio.read()
-    if not audio_bytes:
+    if not await _measure_upload(audio, MAX_BYTES):
         raise HTTPException(400, "Empty audio")
-    max_bytes = int(settings.MAX_UPLOAD_MB * 1024 * 1024)
-    if len(audio_bytes) > max_bytes:
-        raise HTTPException(400, f"Audio exceeds max size of {settings.MAX_UPLOAD_MB} MB")
-    # Convert to WAV if needed
-    input_mime = (audio.content_type or "").split(";")[0].lower() if audio.content_type else None
-    try:
-        if input_mime not in {"audio/wav", "audio/x-wav", "audio/wave"}:
-            audio_bytes = convert_to_wav(audio_bytes, input_mime)
+    # WAV uploads are streamed straight from the spooled file; anything else
+    # has to be materialized for conversion
+    input_mime = (audio.content_type or "").partition(";")[0].lower() or None
+    if input_mime in WAV_MIMES:
+        upload = _UploadReader(audio.file)
+    else:
+        audio_bytes = await audio.read()
+        try:
+            upload = await convert_to_wav_async(audio_bytes, input_mime, executor=executor)
             input_mime = "audio/wav"
-    except Exception as e:
-        raise HTTPException(400, f"WAV conversion failed: {e}")
+        except Exception as e:
+            raise HTTPException(400, f"WAV conversion failed: {e}")
 
     files = {
-        "file": (audio.filename or "audio.wav", audio_bytes, input_mime or "audio/wav"),
+        "file": (audio.filename or "audio.wav", upload, input_mime or "audio/wav"),
     }
-    data = {"model_id": settings.ELEVEN_STT_MODEL_ID}
+    data = {"model_id": STT_MODEL}
     if language:
         data["language_code"] = language
 
-    headers = {
-        "xi-api-key": settings.XI_API_KEY,
-        "accept": "application/json",
-    }
-
-    resp = await http.post(settings.ELEVEN_STT_URL, files=files, data=data, headers=headers)
+    resp = await http.post(STT_URL, files=files, data=data, headers=_STT_HEADERS)
     if resp.status_code >= 400:
         raise HTTPException(resp.status_code, resp.text)
 
     try:
-        result = resp.json()
-    except Exception:
+        result = orjson.loads(resp.content)
+    except orjson.JSONDecodeError:
         raise HTTPException(502, "Invalid STT provider response")
 
     transcript = result.get("text", "")
@@ -57,34 +124,28 @@ async def stt_raw_bytes_to_text(
     language: str | None = None,
 ) -> str:
     """Transcribe raw bytes (for WebSocket or other binary sources)."""
-    if not settings.XI_API_KEY:
+    if not XI_KEY:
         raise HTTPException(500, "XI_API_KEY not set")
 
     if not audio_bytes:
         raise HTTPException(400, "Empty audio")
-    max_bytes = int(settings.MAX_UPLOAD_MB * 1024 * 1024)
-    if len(audio_bytes) > max_bytes:
-        raise HTTPException(400, f"Audio exceeds max size of {settings.MAX_UPLOAD_MB} MB")
+    if len(audio_bytes) > MAX_BYTES:
+        raise HTTPException(400, f"Audio exceeds max size of {MAX_BYTES // (1024 * 1024)} MB")
 
     files = {
         "file": (filename, audio_bytes, content_type or "application/octet-stream"),
     }
-    data = {"model_id": settings.ELEVEN_STT_MODEL_ID}
+    data = {"model_id": STT_MODEL}
     if language:
         data["language_code"] = language
 
-    headers = {
-        "xi-api-key": settings.XI_API_KEY,
-        "accept": "application/json",
-    }
-
-    resp = await http.post(settings.ELEVEN_STT_URL, files=files, data=data, headers=headers)
+    resp = await http.post(STT_URL, files=files, data=data, headers=_STT_HEADERS)
     if resp.status_code >= 400:
         raise HTTPException(resp.status_code, resp.text)
 
     try:
-        result = resp.json()
-    except Exception:
+        result = orjson.loads(resp.content)
+    except orjson.JSONDecodeError:
         raise HTTPException(502, "Invalid STT provider response")
 
     transcript = result.get("text", "")
@@ -1,7 +1,26 @@
-from typing import Optional, Tuple
+from functools import lru_cache
+from typing import AsyncIterator, Optional, Tuple
+from urllib.parse import urlencode
 import httpx
+import orjson
 from fastapi import HTTPException
-from app.core.config import settings
+from app.core.config import get_settings
+
+
+def reload_settings() -> None:
+    """Re-bind this module's settings, TTS headers and body suffix, and drop caches built from them."""
+    global settings, _TTS_HEADERS, _MODEL_SUFFIX
+    settings = get_settings()
+    _TTS_HEADERS = {
+        "xi-api-key": settings.XI_API_KEY,
+        "accept": "*/*",
+        "content-type": "application/json",
+    }
+    # Everything in the TTS JSON body after the text; only the text is encoded per request
+    _MODEL_SUFFIX = b',"model_id":' + orjson.dumps(settings.ELEVEN_TTS_MODEL_ID) + b"}"
+    # These cache values derived from the old settings
+    _voice_for_type.cache_clear()
+    _build_tts_request.cache_clear()
 
 
 _TYPE_TO_VOICE_ENV = {
@@ -12,6 +31,7 @@ _TYPE_TO_VOICE_ENV = {
 }
 
 
+@lru_cache(maxsize=16)
 def _voice_for_type(response_type: Optional[str]) -> str:
     """Pick voice_id from settings based on response type; fallback to DEFAULT_VOICE_ID."""
     if response_type:
@@ -23,16 +43,29 @@ def _voice_for_type(response_type: Optional[str]) -> str:
     return settings.DEFAULT_VOICE_ID
 
 
+# ElevenLabs output_format codec prefix ("mp3_44100_128" -> "mp3") to media type
+_FMT2MIME = {
+    "mp3": "audio/mpeg",
+    "ogg": "audio/ogg",
+    "wav": "audio/wav",
+}
+
+
+@lru_cache(maxsize=16)
 def _media_type_for_format(fmt: str) -> str:
-    fmt = (fmt or "").lower()
-    if fmt.startswith("mp3_") or fmt == "mp3":
-        return "audio/mpeg"
-    if fmt.startswith("ogg_") or fmt == "ogg":
-        return "audio/ogg"
-    if fmt.startswith("wav_") or fmt == "wav":
-        return "audio/wav"
-    # default
-    return "audio/mpeg"
+    # default audio/mpeg
+    return _FMT2MIME.get((fmt or "").partition("_")[0].lower(), "audio/mpeg")
+
+
+@lru_cache(maxsize=64)
+def _build_tts_request(voice_id: str, fmt: str) -> Tuple[str, Tuple[Tuple[str, str], ...], str]:
+    """Everything about a TTS request except its text: (url, header items, media_type)."""
+    url_base = settings.ELEVEN_TTS_URL_TMPL.format(voice_id=voice_id)
+    url = f"{url_base}/stream?{urlencode({'output_format': fmt})}"
+    return url, tuple(_TTS_HEADERS.items()), _media_type_for_format(fmt)
+
+
+reload_settings()
 
 
 async def text_to_speech(
@@ -41,36 +74,20 @@ async def text_to_speech(
     response_type: Optional[str] = None,
     voice_id: Optional[str] = None,
     output_format: Optional[str] = None,
-) -> Tuple[bytes, str]:
-    if not settings.XI_API_KEY:
-        raise HTTPException(500, "XI_API_KEY not set")
-    if not text or not text.strip():
-        raise HTTPException(400, "Text is empty")
-
-    chosen_voice = (voice_id or _voice_for_type(response_type) or settings.DEFAULT_VOICE_ID).strip()
-    if not chosen_voice:
-        raise HTTPException(500, "No voice_id available (DEFAULT_VOICE_ID not set)")
-    fmt = (output_format or settings.DEFAULT_TTS_FORMAT or "mp3_44100_128").strip()
-    url_base = settings.ELEVEN_TTS_URL_TMPL.format(voice_id=chosen_voice)
-    url = f"{url_base}/stream"
-
-    headers = {
-        "xi-api-key": settings.XI_API_KEY,
-        "accept": "*/*",
-    }
-    params = {"output_format": fmt}
-    json_body = {
-        "text": text,
-        "model_id": settings.ELEVEN_TTS_MODEL_ID,
-    }
-
-    resp = await http.post(url, headers=headers, params=params, json=json_body)
-    if resp.status_code >= 400:
-        raise HTTPException(resp.status_code, resp.text)
+) -> Tuple[AsyncIterator[bytes], str]:
+    """
+    Synthesize text with ElevenLabs TTS.
 
-    audio_bytes = resp.content
-    media_type = _media_type_for_format(fmt)
-    return audio_bytes, media_type
+    The audio is never buffered here: this shares stream_text_to_speech and
+    returns (async iterator of bytes, media_type) for the caller to forward.
+    """
+    return await stream_text_to_speech(
+        http=http,
+        text=text,
+        response_type=response_type,
+        voice_id=voice_id,
+        output_format=output_format,
+    )
 
 
 async def stream_text_to_speech(
@@ -95,27 +112,16 @@ async def stream_text_to_speech(
         raise HTTPException(500, "No voice_id available (DEFAULT_VOICE_ID not set)")
     fmt = (output_format or settings.DEFAULT_TTS_FORMAT or "mp3_44100_128").strip()
 
-    url_base = settings.ELEVEN_TTS_URL_TMPL.format(voice_id=chosen_voice)
-    url = f"{url_base}/stream"
-
-    headers = {
-        "xi-api-key": settings.XI_API_KEY,
-        "accept": "*/*",
-    }
-    params = {"output_format": fmt}
-    json_body = {
-        "text": text,
-        "model_id": settings.ELEVEN_TTS_MODEL_ID,
-    }
+    url, headers, media_type = _build_tts_request(chosen_voice, fmt)
+    body = b'{"text":' + orjson.dumps(text) + _MODEL_SUFFIX
 
     async def _aiter():
         # Open streaming response within generator so the response context stays alive
-        async with http.stream("POST", url, headers=headers, params=params, json=json_body) as resp:
+        async with http.stream("POST", url, headers=headers, content=body) as resp:
             if resp.status_code >= 400:
                 detail = await resp.aread()
                 raise HTTPException(resp.status_code, detail.decode(errors="ignore"))
-            async for chunk in resp.aiter_bytes():
+            async for chunk in resp.aiter_bytes(chunk_size=settings.TTS_STREAM_CHUNK_BYTES or None):
                 yield chunk
 
-    media_type = _media_type_for_format(fmt)
     return _aiter(), media_type
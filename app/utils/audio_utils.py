@@ -1,31 +1,29 @@
+import asyncio
 import io
 import os
+import struct
 import subprocess
-import tempfile
-import uuid
-from typing import Optional
+from array import array
+from concurrent.futures import Executor
+from functools import lru_cache, partial
+from typing import Optional, Tuple
 from app.core.config import settings
 
 
-_MIME_EXT = {
-    "audio/webm": ".webm",
-    "audio/ogg": ".ogg",
-    "audio/mpeg": ".mp3",
-    "audio/mp3": ".mp3",
-    "audio/wav": ".wav",
-    "audio/x-wav": ".wav",
-    "audio/wave": ".wav",
-}
-
+WAV_MIMES = frozenset({"audio/wav", "audio/x-wav", "audio/wave"})
 
-def _ext_for_mime(mime: Optional[str]) -> str:
-    if not mime:
-        return ".bin"
-    return _MIME_EXT.get(mime.split(";")[0].strip().lower(), ".bin")
+# ffmpeg demuxer names for the containers _sniff_mime recognizes
+_FFMPEG_INPUT_FORMATS = {
+    "audio/webm": "webm",
+    "audio/ogg": "ogg",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+}
 
 
+@lru_cache(maxsize=1)
 def _get_ffmpeg_bin() -> str:
-    """Resolve ffmpeg executable path from environment variables or PATH."""
+    """Resolve ffmpeg executable path from environment variables or PATH (once per process)."""
     # Prefer app settings from .env
     for val in (settings.FFMPEG_PATH, settings.FFMPEG_BIN):
         if val and val.strip():
@@ -39,7 +37,7 @@ def _get_ffmpeg_bin() -> str:
     return "ffmpeg"
 
 
-def _sniff_mime(data: bytes) -> Optional[str]:
+def _sniff_mime(data: bytes | bytearray | memoryview) -> Optional[str]:
     """Best-effort container/format sniffing from magic bytes.
     Returns one of: 'audio/wav', 'audio/ogg', 'audio/mpeg', 'audio/webm', or None.
     """
@@ -62,97 +60,148 @@ def _sniff_mime(data: bytes) -> Optional[str]:
     return None
 
 
+def _parse_wav_header(data: bytes | bytearray | memoryview) -> Optional[Tuple[int, int, int]]:
+    """(channels, sample_rate, bits_per_sample) of a PCM WAV whose fmt chunk comes first, else None."""
+    if len(data) < 36 or data[:4] != b"RIFF" or data[8:16] != b"WAVEfmt ":
+        return None
+    audio_format, channels, sample_rate = struct.unpack_from("<HHI", data, 20)
+    if audio_format != 1:
+        return None
+    (bits,) = struct.unpack_from("<H", data, 34)
+    return channels, sample_rate, bits
+
+
+def pcm16_to_wav(pcm, sample_rate: int = 16000, channels: int = 1) -> bytes:
+    """Wrap little-endian 16-bit PCM in a minimal 44-byte RIFF/WAVE header."""
+    data = memoryview(pcm)
+    header = struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data.nbytes, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, sample_rate * channels * 2, channels * 2, 16,
+        b"data", data.nbytes,
+    )
+    return header + data
+
+
+def _l16_to_wav(pcm, mime: str) -> bytes:
+    """Convert audio/L16 (RFC 2586: big-endian 16-bit PCM, rate/channels as mime params) to WAV."""
+    params = dict(p.strip().lower().partition("=")[::2] for p in mime.split(";")[1:])
+    samples = array("h")
+    samples.frombytes(pcm)
+    samples.byteswap()
+    return pcm16_to_wav(samples, int(params.get("rate") or 16000), int(params.get("channels") or 1))
+
+
+def _base_mime(mime: Optional[str]) -> Optional[str]:
+    """'Audio/WebM; codecs=opus' -> 'audio/webm'."""
+    return mime.partition(";")[0].strip().lower() if mime else None
+
+
+def _convert_without_ffmpeg(
+    audio_bytes: bytes | bytearray | memoryview,
+    input_mime: Optional[str],
+    sample_rate: int,
+    channels: int,
+) -> Optional[bytes]:
+    """WAV for inputs that need no ffmpeg run, or None. Raises RuntimeError on empty input."""
+    if not audio_bytes:
+        raise RuntimeError("Empty audio bytes")
+
+    # If caller already knows it's WAV, just return as-is; raw PCM only needs a header
+    base_mime = _base_mime(input_mime)
+    if base_mime in WAV_MIMES:
+        return bytes(audio_bytes)
+    if base_mime == "audio/l16":
+        return _l16_to_wav(audio_bytes, input_mime)
+
+    # Mislabelled (or unlabelled) WAV that is already in the target format
+    if _parse_wav_header(audio_bytes) == (channels, sample_rate, 16):
+        return bytes(audio_bytes)
+    return None
+
+
+def _ffmpeg_to_wav(
+    audio_bytes: bytes | bytearray | memoryview,
+    input_mime: Optional[str],
+    sample_rate: int,
+    channels: int,
+) -> bytes:
+    # Prefer sniffed mime if provided value seems wrong or missing
+    base_mime = _sniff_mime(audio_bytes) or _base_mime(input_mime)
+
+    # Audio goes in on stdin and comes back on stdout, so nothing touches disk.
+    # ffmpeg cannot seek back into a pipe to fix up WAV header sizes, so it
+    # emits raw PCM and the header is added here.
+    def run_ffmpeg(force_fmt: Optional[str] = None) -> subprocess.CompletedProcess:
+        cmd = [
+            _get_ffmpeg_bin(),
+            "-hide_banner",
+            "-loglevel", "error",
+            "-nostdin",
+        ]
+        if force_fmt:
+            cmd += ["-f", force_fmt]
+        cmd += [
+            "-i", "pipe:0",
+            "-vn",
+            "-ac", str(channels),
+            "-ar", str(sample_rate),
+            "-f", "s16le",
+            "pipe:1",
+        ]
+        return subprocess.run(cmd, input=audio_bytes, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    # One ffmpeg run with the (sniffed) container format forced; only if that
+    # fails, one more run letting ffmpeg probe the input itself
+    forced = _FFMPEG_INPUT_FORMATS.get(base_mime)
+    proc = run_ffmpeg(force_fmt=forced)
+    if forced and (proc.returncode != 0 or not proc.stdout):
+        proc = run_ffmpeg(force_fmt=None)
+    if proc.returncode != 0:
+        raise RuntimeError(
+            f"ffmpeg failed: code={proc.returncode}, stderr={(proc.stderr or b'').decode(errors='ignore')[:800]}"
+        )
+    if not proc.stdout:
+        raise RuntimeError("ffmpeg produced empty output")
+    return pcm16_to_wav(proc.stdout, sample_rate, channels)
+
+
 def convert_to_wav(
-    audio_bytes: bytes,
+    audio_bytes: bytes | bytearray | memoryview,
     input_mime: Optional[str] = None,
     sample_rate: int = 16000,
     channels: int = 1,
 ) -> bytes:
     """
     Convert arbitrary audio bytes (e.g., webm/ogg/mp3) to WAV using ffmpeg.
+    Accepts any bytes-like object, so callers can pass a memoryview of a
+    buffer without copying it. Always returns bytes.
     Requires ffmpeg binary available in PATH. Raises RuntimeError on failure.
     """
-    if not audio_bytes:
-        raise RuntimeError("Empty audio bytes")
+    wav = _convert_without_ffmpeg(audio_bytes, input_mime, sample_rate, channels)
+    if wav is not None:
+        return wav
+    return _ffmpeg_to_wav(audio_bytes, input_mime, sample_rate, channels)
 
-    # If caller already knows it's WAV, just return as-is
-    if input_mime and input_mime.split(";")[0].strip().lower() in {"audio/wav", "audio/x-wav", "audio/wave"}:
-        return audio_bytes
 
-    # Prefer sniffed mime if provided value seems wrong or missing
-    sniffed = _sniff_mime(audio_bytes)
-    if sniffed and (not input_mime or sniffed.split(";")[0].lower() != input_mime.split(";")[0].lower()):
-        input_mime = sniffed
-
-    in_ext = _ext_for_mime(input_mime)
-    # Write input to a temp file and close it (Windows requires closed handle for external processes)
-    with tempfile.NamedTemporaryFile(delete=False, suffix=in_ext) as f_in:
-        f_in.write(audio_bytes)
-        in_path = f_in.name
-
-    # Create a unique output path without pre-creating the file to avoid Windows locking issues
-    out_path = os.path.join(tempfile.gettempdir(), f"aud_{uuid.uuid4().hex}.wav")
-    try:
-        def run_ffmpeg(force_fmt: Optional[str] = None) -> subprocess.CompletedProcess:
-            cmd = [
-                _get_ffmpeg_bin(),
-                "-hide_banner",
-                "-loglevel", "error",
-                "-nostdin",
-            ]
-            if force_fmt:
-                cmd += ["-f", force_fmt]
-            cmd += [
-                "-i", in_path,
-                "-vn",
-                "-ac", str(channels),
-                "-ar", str(sample_rate),
-                "-f", "wav",
-                out_path,
-            ]
-            return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-        # Try sequence: sniffed format first, then common fallbacks, then auto-detect
-        fmt_map = {
-            "audio/webm": "webm",
-            "audio/ogg": "ogg",
-            "audio/mpeg": "mp3",
-            "audio/mp3": "mp3",
-        }
-        tries = []
-        if input_mime and input_mime in fmt_map:
-            tries.append(fmt_map[input_mime])
-        # Add common fallbacks
-        for f in ("webm", "ogg", "mp3"):
-            if f not in tries:
-                tries.append(f)
-
-        proc = None
-        for f in tries:
-            proc = run_ffmpeg(force_fmt=f)
-            if proc.returncode == 0 and os.path.exists(out_path):
-                break
-        if not proc or proc.returncode != 0 or (not os.path.exists(out_path)):
-            # Final retry with auto-detect (no forced format)
-            proc = run_ffmpeg(force_fmt=None)
-        if proc.returncode != 0 or (not os.path.exists(out_path)):
-            raise RuntimeError(
-                f"ffmpeg failed: code={proc.returncode}, stderr={(proc.stderr or b'').decode(errors='ignore')[:800]}"
-            )
-
-        # Read the produced WAV bytes
-        with open(out_path, "rb") as f:
-            data = f.read()
-        if not data:
-            raise RuntimeError("ffmpeg produced empty output")
-        return data
-    finally:
-        try:
-            os.remove(in_path)
-        except Exception:
-            pass
-        if out_path and os.path.exists(out_path):
-            try:
-                os.remove(out_path)
-            except Exception:
-                pass
+async def convert_to_wav_async(
+    audio_bytes: bytes | bytearray | memoryview,
+    input_mime: Optional[str] = None,
+    sample_rate: int = 16000,
+    channels: int = 1,
+    executor: Optional[Executor] = None,
+) -> bytes:
+    """
+    Like convert_to_wav, but the ffmpeg run happens on an executor so it never
+    blocks the event loop. Pass the app's bounded ffmpeg pool
+    (app.state.ffmpeg_pool) to cap concurrent conversions; None falls back to
+    the loop's default executor.
+    """
+    # Pass-through inputs are not worth a thread hop
+    wav = _convert_without_ffmpeg(audio_bytes, input_mime, sample_rate, channels)
+    if wav is not None:
+        return wav
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor, partial(_ffmpeg_to_wav, audio_bytes, input_mime, sample_rate, channels)
+    )
@@ -1,7 +1,34 @@
 import re
+from typing import Optional, Tuple
 
 
 _TYPE_TAG_RE = re.compile(r"\[\[type:([a-zA-Z0-9_\-]+)\]\]")
+_MD_LINK_RE = re.compile(r"\[([^\]]+)\]\(([^)]+)\)")
+# A lone * or _ unless it sits between two word characters. Leading with the
+# character class lets the engine skip ahead to candidates instead of trying
+# three lookbehind branches at every position
+_EMPHASIS_RE = re.compile(r"[*_](?:(?<!\w[*_])|(?!\w))")
+_HEADING_RE = re.compile(r"^\s*#+\s*", re.MULTILINE)
+_PUNCT_SPACE_RE = re.compile(r"\s+([,.!?…])")
+_WHITESPACE_RE = re.compile(r"\s{2,}|[^\S ]")
+
+# Characters that steps 1-5 of clean_for_tts act on; text without any of
+# them (most LLM replies) can skip those passes entirely
+_MARKUP_CHARS = frozenset("[*_`#\\")
+
+
+def split_type_tag(text: str) -> Tuple[Optional[str], str]:
+    """Extract the first [[type:...]] tag from text.
+
+    Returns (type, text with all tags removed and stripped), or (None, text)
+    unchanged when no tag is present. Only the text after the first match is
+    scanned again, so the string is walked once.
+    """
+    m = _TYPE_TAG_RE.search(text)
+    if not m:
+        return None, text
+    tail = _TYPE_TAG_RE.sub("", text[m.end():])
+    return m.group(1), (text[:m.start()] + tail).strip()
 
 
 def clean_for_tts(text: str) -> str:
@@ -18,43 +45,42 @@ def clean_for_tts(text: str) -> str:
 
     s = str(text)
 
-    # 1) Remove [[type:...]] tag if any
-    s = _TYPE_TAG_RE.sub("", s)
+    if not _MARKUP_CHARS.isdisjoint(s):
+        # 1) Remove [[type:...]] tag if any
+        s = _TYPE_TAG_RE.sub("", s)
 
-    # 2) Convert escaped newlines to real newlines, then reduce to sentence breaks
-    s = s.replace("\\n", "\n")
-    # Normalize CRLF
-    s = s.replace("\r\n", "\n")
+        # 2) Convert escaped newlines to real newlines, then reduce to sentence breaks
+        s = s.replace("\\n", "\n")
+        # Normalize CRLF
+        s = s.replace("\r\n", "\n")
 
-    # 3) Strip Markdown links [label](url) -> label
-    s = re.sub(r"\[([^\]]+)\]\(([^)]+)\)", r"\1", s)
+        # 3) Strip Markdown links [label](url) -> label
+        s = _MD_LINK_RE.sub(r"\1", s)
 
-    # 4) Remove emphasis markers and backticks
-    s = s.replace("**", "").replace("__", "")
-    s = s.replace("`", "")
-    # Single * or _ often used for italics; remove when around word boundaries
-    s = re.sub(r"(?<!\w)[*_](?!\w)|(?<=\w)[*_](?!\w)|(?<!\w)[*_](?=\w)", "", s)
+        # 4) Remove emphasis markers and backticks
+        s = s.replace("**", "").replace("__", "")
+        s = s.replace("`", "")
+        # Single * or _ often used for italics; remove when around word boundaries
+        s = _EMPHASIS_RE.sub("", s)
 
-    # 5) Remove leading markdown headings (#)
-    s = re.sub(r"^\s*#+\s*", "", s, flags=re.MULTILINE)
+        # 5) Remove leading markdown headings (#)
+        s = _HEADING_RE.sub("", s)
 
     # 6) Replace newlines with sentence breaks
     # If a line ends without terminal punctuation, add a period to improve TTS cadence
-    lines = [ln.strip() for ln in s.split("\n") if ln.strip()]
-    processed = []
-    for ln in lines:
-        if not re.search(r"[.!?…]$", ln):
-            processed.append(ln + ".")
-        else:
-            processed.append(ln)
-    s = " ".join(processed)
+    s = s.strip()
+    if "\n" in s:
+        lines = filter(None, map(str.strip, s.split("\n")))
+        s = " ".join(ln if ln[-1] in ".!?…" else ln + "." for ln in lines)
+    elif s and s[-1] not in ".!?…":
+        s += "."
 
     # 7) Fix spacing around punctuation
-    s = re.sub(r"\s+([,.!?…])", r"\1", s)
-    s = re.sub(r"\(\s+", "(", s)
-    s = re.sub(r"\s+\)", ")", s)
+    s = _PUNCT_SPACE_RE.sub(r"\1", s)
 
-    # 8) Collapse extra spaces
-    s = re.sub(r"\s{2,}", " ", s).strip()
+    # 8) Collapse whitespace runs (and stray tabs/CRs) to single spaces; after
+    # that, padding inside parentheses is at most one space
+    s = _WHITESPACE_RE.sub(" ", s).strip()
+    s = s.replace("( ", "(").replace(" )", ")")
 
     return s
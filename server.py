@@ -1,5 +1,7 @@
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 import logging
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import httpx
@@ -15,14 +17,29 @@ logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Create shared HTTP client
-    app.state.http_client = httpx.AsyncClient(timeout=settings.HTTP_TIMEOUT_S)
+    # Create shared HTTP client. HTTP/2 multiplexes STT, TTS and n8n requests
+    # over a few long-lived connections instead of a TLS handshake per request.
+    # Limits come from settings. No custom transport is passed: that would stop
+    # httpx from honouring HTTP(S)_PROXY / NO_PROXY from the environment.
+    app.state.http_client = httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(settings.HTTP_TIMEOUT_S, connect=5.0),
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_S,
+        ),
+    )
     logger.info("HTTP client initialized")
+    # Bounded pool for ffmpeg conversions: keeps them off the event loop and
+    # caps concurrent ffmpeg processes at the CPU count
+    app.state.ffmpeg_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="ffmpeg")
     try:
         yield
     finally:
         await app.state.http_client.aclose()
         logger.info("HTTP client closed")
+        app.state.ffmpeg_pool.shutdown(wait=False, cancel_futures=True)
 
 app = FastAPI(
     title="Speech AI Bridge",